@@ -1,4 +1,61 @@
-import csv
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
+from math import exp, expm1, fsum, isclose, log1p
+from operator import mul
+
+try:
+    from math import sumprod
+except ImportError:  # Python < 3.12
+    def sumprod(p, q):
+        return sum(map(mul, p, q))
+
+
+def _fixed_payment(principal, r, term_periods):
+    """
+    Fixed per-period payment that amortizes principal over term_periods at periodic rate r.
+    """
+    if r == 0:
+        return principal / term_periods
+    # 1 - (1+r)^-n, computed in log space so small rates keep full precision
+    return (principal * r) / -expm1(-term_periods * log1p(r))
+
+
+@lru_cache(maxsize=64)
+def _amortization_columns(principal, r, term_periods):
+    """
+    Interest and principal paid for each period of a single loan, as two parallel
+    tuples of raw floats. Results are cached, hence tuples: callers share them and
+    must not be able to mutate them.
+
+    Both are derived from the remaining balances, which come from the closed form
+    principal*(1+r)^k - pmt*((1+r)^k - 1)/r, so no period depends on the one before
+    it. The final balance is pinned to zero so the last payment clears the loan exactly.
+    """
+    pmt = _fixed_payment(principal, r, term_periods)
+
+    if r == 0:
+        balances = [principal - pmt * k for k in range(1, term_periods + 1)]
+    else:
+        log_growth = log1p(r)
+        balances = [
+            principal * exp(k * log_growth) - pmt * expm1(k * log_growth) / r
+            for k in range(1, term_periods + 1)
+        ]
+    balances[-1] = 0.0
+
+    previous = [principal] + balances[:-1]
+    interest = [b * r for b in previous]
+    principal_paid = [prev - b for prev, b in zip(previous, balances)]
+    return tuple(interest), tuple(principal_paid)
+
+
+# Fields of each per-period record, in transaction history CSV column order
+HISTORY_FIELDS = ('Period', 'Total Payment Received', 'Interest Collected', 'Principal Repaid',
+                  'Active Loans', 'New Loans Issued', 'Cash Available for Loans', 'Total Loans Issued')
+
 
 class LoanPortfolio:
     def __init__(self, principal, annual_interest_rate, term_years=5, periods_per_year=12):
@@ -6,87 +63,148 @@ class LoanPortfolio:
         self.annual_interest_rate = annual_interest_rate
         self.term_years = term_years
         self.periods_per_year = periods_per_year
-        self.term_periods = term_years * periods_per_year
+        term_periods = term_years * periods_per_year
+        # Float products such as 1.4 * 365 can land a hair off a whole number of periods
+        self.term_periods = round(term_periods)
+        if not isclose(term_periods, self.term_periods, abs_tol=1e-9):
+            raise ValueError(
+                f"term_years * periods_per_year must be a whole number of periods, got {term_periods}"
+            )
         
         self.r = annual_interest_rate / periods_per_year
-        if self.r == 0:
-            self.fixed_pmt = principal / self.term_periods
-        else:
-            self.fixed_pmt = (principal * self.r) / (1 - (1 + self.r) ** -self.term_periods)
+        self.fixed_pmt = _fixed_payment(principal, self.r, self.term_periods)
+        # At a zero rate no interest is ever collected, so step skips that reduction
+        self._zero_rate = self.r == 0
+        
+        # Every loan has the same principal, rate and term, so all loans follow one
+        # schedule shifted in time. Only the per-age amounts of a single loan are kept.
+        self.interest_by_age, self.principal_by_age = _amortization_columns(
+            principal, self.r, self.term_periods
+        )
         
-        self.active_loans = [{'start_period': 1, 'remaining_balance': principal}]
+        # Loan counts per cohort, newest first so that position == loan age. Loans
+        # retire in issue order, so a bounded deque drops the finished cohort on its own.
+        # The deque is kept full-length (zero-padded) so it lines up with the per-age tables.
+        self.cohort_counts = deque([1] + [0] * (self.term_periods - 1), maxlen=self.term_periods)
+        self.active_loan_count = 1
         self.total_loans_issued = 1
         
         self.cash_balance = 0.0
         self.current_period = 0
 
     def step(self):
+        return dict(zip(HISTORY_FIELDS, self._advance()))
+    
+    def _advance(self):
+        """
+        Simulate one period and return its record as a tuple in HISTORY_FIELDS order.
+        """
         self.current_period += 1
+        period = self.current_period
+        principal = self.principal
+        cohort_counts = self.cohort_counts
         
-        period_payment_total = 0
-        period_interest_total = 0
-        period_principal_total = 0
-        new_loans_issued = 0
+        period_interest_total = 0.0 if self._zero_rate else sumprod(cohort_counts, self.interest_by_age)
+        period_principal_total = sumprod(cohort_counts, self.principal_by_age)
+        period_payment_total = period_interest_total + period_principal_total
         
-        loans_to_remove = []
-        for loan in self.active_loans:
-            loan_age = self.current_period - loan['start_period'] + 1
-            if loan_age <= 0 or loan['remaining_balance'] <= 0:
-                continue
-            
-            interest = loan['remaining_balance'] * self.r
-            principal_payment = self.fixed_pmt - interest
-            
-            if principal_payment > loan['remaining_balance']:
-                principal_payment = loan['remaining_balance']
-                payment = principal_payment + interest
-            else:
-                payment = self.fixed_pmt
-            
-            loan['remaining_balance'] -= principal_payment
-            
-            period_payment_total += payment
-            period_interest_total += interest
-            period_principal_total += principal_payment
-            
-            if loan['remaining_balance'] <= 1e-8:
-                loans_to_remove.append(loan)
-        
-        for loan in loans_to_remove:
-            self.active_loans.remove(loan)
+        # The oldest cohort just made its final payment
+        self.active_loan_count -= cohort_counts[-1]
         
         # Add payment to cash
-        self.cash_balance += period_payment_total
+        cash_balance = self.cash_balance + period_payment_total
         
-        # Issue new loans as cash allows
-        while self.cash_balance >= self.principal:
-            self.active_loans.append({'start_period': self.current_period, 'remaining_balance': self.principal})
-            self.cash_balance -= self.principal
-            self.total_loans_issued += 1
-            new_loans_issued += 1
+        # Issue as many new loans as cash allows in one batch; they start repaying next period
+        new_loans_issued = int(cash_balance // principal)
+        cohort_counts.appendleft(new_loans_issued)
+        if new_loans_issued:
+            cash_balance -= new_loans_issued * principal
+            self.active_loan_count += new_loans_issued
+            self.total_loans_issued += new_loans_issued
+        self.cash_balance = cash_balance
         
-        return {
-            'Period': self.current_period,
-            'Total Payment Received': round(period_payment_total, 2),
-            'Interest Collected': round(period_interest_total, 2),
-            'Principal Repaid': round(period_principal_total, 2),
-            'Active Loans': len(self.active_loans),
-            'New Loans Issued': new_loans_issued,
-            'Cash Available for Loans': round(self.cash_balance, 2),
-            'Total Loans Issued': self.total_loans_issued
-        }
+        return (period, period_payment_total, period_interest_total, period_principal_total,
+                self.active_loan_count, new_loans_issued, cash_balance, self.total_loans_issued)
     
-    def run_full_investment(self, total_periods):
+    def run_full_investment(self, total_periods, record_history=True):
         """
         Simulate the investment for the given number of periods and return total earned and full transaction history.
+        
+        The history is one dict per period. Callers that only need the total can pass
+        record_history=False; no history is kept and None is returned in its place.
+        
+        The per-period payments are combined with math.fsum rather than a running sum.
         """
-        total_earned = 0.0
-        history = []
-        for _ in range(total_periods):
-            info = self.step()
-            total_earned += info['Total Payment Received']
-            history.append(info)
-        return total_earned, history
+        # Both are preallocated to the run length and filled in period order
+        earnings = [0.0] * total_periods
+        rows = [None] * total_periods if record_history else None
+        for i in range(total_periods):
+            row = self._advance()
+            earnings[i] = row[1]
+            if record_history:
+                rows[i] = row
+        
+        history = [dict(zip(HISTORY_FIELDS, row)) for row in rows] if record_history else None
+        return fsum(earnings), history
+
+
+def _scenario_total_earned(scenario):
+    principal, annual_interest_rate, term_years, periods_per_year, total_periods = scenario
+    portfolio = LoanPortfolio(principal, annual_interest_rate, term_years, periods_per_year)
+    total_earned, _ = portfolio.run_full_investment(total_periods, record_history=False)
+    return total_earned
+
+
+# Below this many scenarios, starting worker processes costs more than it saves
+PARALLEL_BATCH_THRESHOLD = 64
+
+
+def run_batch(principals, annual_interest_rates, total_periods, term_years=5, periods_per_year=12,
+              max_workers=None):
+    """
+    Simulate one portfolio per (principal, annual_interest_rate) pair and return the total
+    earned by each, in input order. Large batches are spread across worker processes;
+    small ones run in this process.
+    """
+    principals = list(principals)
+    annual_interest_rates = list(annual_interest_rates)
+    if len(principals) != len(annual_interest_rates):
+        raise ValueError(
+            f"Got {len(principals)} principals but {len(annual_interest_rates)} interest rates"
+        )
+    if max_workers is not None and max_workers <= 0:
+        raise ValueError(f"max_workers must be greater than 0, got {max_workers}")
+    scenarios = [
+        (principal, rate, term_years, periods_per_year, total_periods)
+        for principal, rate in zip(principals, annual_interest_rates)
+    ]
+    if len(scenarios) < PARALLEL_BATCH_THRESHOLD or max_workers == 1:
+        return list(map(_scenario_total_earned, scenarios))
+    
+    workers = max_workers or os.cpu_count() or 1
+    chunksize = max(1, len(scenarios) // (4 * workers))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_scenario_total_earned, scenarios, chunksize=chunksize))
+
+
+# Rows formatted and written per write() call by write_history_csv
+CSV_WRITE_BATCH = 10000
+
+
+def write_history_csv(path, rows):
+    """
+    Write period records (tuples in HISTORY_FIELDS order) to a CSV file at path.
+
+    Every field is numeric and needs no quoting, so rows are formatted directly with
+    CRLF line endings; money columns are rounded to cents only here. Rows are written
+    in batches so long runs never hold the whole file text in memory.
+    """
+    row_format = '%d,%.2f,%.2f,%.2f,%d,%d,%.2f,%d\r\n'
+    rows = iter(rows)
+    with open(path, mode='w', newline='', buffering=1 << 20) as csvfile:
+        csvfile.write(','.join(HISTORY_FIELDS) + '\r\n')
+        for batch in iter(lambda: list(islice(rows, CSV_WRITE_BATCH)), []):
+            csvfile.write(''.join([row_format % row for row in batch]))
 
 
 def input_with_default(prompt, default, cast_func=str):
@@ -119,19 +237,14 @@ def main():
     portfolio = LoanPortfolio(principal, annual_rate, term_years, periods_per_year)
     
     print(f"\nRunning simulation for {n_years} years ({total_periods} periods) with transaction history...")
-    total_earned, transaction_history = portfolio.run_full_investment(total_periods)
+    # The CSV is written from the raw period records, so no per-period dict is built
+    transaction_history = [portfolio._advance() for _ in range(total_periods)]
+    total_earned = fsum(row[1] for row in transaction_history)
     
     print(f"\nTotal amount earned (all payments received) over {total_periods} periods ({n_years} years): ${total_earned:,.2f}")
     
-    # Write transaction history CSV
     csv_filename = 'transaction_history.csv'
-    with open(csv_filename, mode='w', newline='') as csvfile:
-        fieldnames = ['Period', 'Total Payment Received', 'Interest Collected', 'Principal Repaid',
-                      'Active Loans', 'New Loans Issued', 'Cash Available for Loans', 'Total Loans Issued']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        for record in transaction_history:
-            writer.writerow(record)
+    write_history_csv(csv_filename, transaction_history)
     
     print(f"Transaction history saved to '{csv_filename}'.")
 
@@ -0,0 +1,143 @@
+import os
+import tempfile
+import unittest
+
+from roi_calc import CSV_WRITE_BATCH, PARALLEL_BATCH_THRESHOLD, LoanPortfolio, run_batch, write_history_csv
+
+
+class ReferencePortfolio:
+    """
+    The original one-record-per-loan model, kept to check the cohort model against.
+    """
+    def __init__(self, principal, annual_interest_rate, term_years=5, periods_per_year=12):
+        self.principal = principal
+        self.r = annual_interest_rate / periods_per_year
+        term_periods = term_years * periods_per_year
+        if self.r == 0:
+            self.fixed_pmt = principal / term_periods
+        else:
+            self.fixed_pmt = (principal * self.r) / (1 - (1 + self.r) ** -term_periods)
+        self.balances = [principal]
+        self.total_loans_issued = 1
+        self.cash_balance = 0.0
+
+    def step(self):
+        payment_total = 0.0
+        remaining = []
+        for balance in self.balances:
+            interest = balance * self.r
+            principal_payment = min(self.fixed_pmt - interest, balance)
+            payment_total += principal_payment + interest
+            balance -= principal_payment
+            if balance > 1e-8:
+                remaining.append(balance)
+        self.balances = remaining
+        self.cash_balance += payment_total
+        while self.cash_balance >= self.principal:
+            self.balances.append(self.principal)
+            self.cash_balance -= self.principal
+            self.total_loans_issued += 1
+        return payment_total, len(self.balances), self.total_loans_issued
+
+    def run(self, total_periods):
+        return [self.step() for _ in range(total_periods)]
+
+
+class CohortModelTest(unittest.TestCase):
+    def assert_matches_reference(self, principal, rate, term_years, periods_per_year, total_periods):
+        expected = ReferencePortfolio(principal, rate, term_years, periods_per_year).run(total_periods)
+        _, history = LoanPortfolio(principal, rate, term_years, periods_per_year).run_full_investment(total_periods)
+        for (payment, active, issued), record in zip(expected, history):
+            self.assertAlmostEqual(record['Total Payment Received'], payment, delta=max(1e-6, payment * 1e-9))
+            self.assertEqual(record['Active Loans'], active)
+            self.assertEqual(record['Total Loans Issued'], issued)
+
+    def test_matches_per_loan_model(self):
+        self.assert_matches_reference(1000, 0.12, 5, 12, 180)
+        self.assert_matches_reference(30000, 0.12, 5, 12, 360)
+        self.assert_matches_reference(12345.67, 0.07, 3, 4, 80)
+        self.assert_matches_reference(500, 0.3, 2, 12, 240)
+
+    def test_fractional_term_years(self):
+        self.assert_matches_reference(1000, 0.12, 2.5, 12, 40)
+
+    def test_rejects_partial_periods(self):
+        with self.assertRaises(ValueError):
+            LoanPortfolio(1000, 0.12, 2.3, 12)
+        # 1.4 * 365 is 510.99999999999994 in floating point
+        self.assertEqual(LoanPortfolio(1000, 0.12, 1.4, 365).term_periods, 511)
+
+    def test_zero_rate_reinvests_repaid_principal(self):
+        # The per-loan model ends each term a hair short of the principal and never reinvests
+        reference = ReferencePortfolio(1000, 0).run(600)
+        self.assertAlmostEqual(sum(payment for payment, _, _ in reference), 1000.0)
+        total_earned, history = LoanPortfolio(1000, 0).run_full_investment(600)
+        self.assertAlmostEqual(total_earned, 10000.0)
+        self.assertEqual(history[-1]['Total Loans Issued'], 11)
+
+    def test_large_principal_retires_after_full_term(self):
+        # The per-loan model leaves a residue above 1e-8 and keeps the loan one extra period
+        reference = ReferencePortfolio(1e9, 0.12).run(105)
+        self.assertEqual(reference[59][1], 2)
+        self.assertEqual(reference[104][1], 3)
+        _, history = LoanPortfolio(1e9, 0.12).run_full_investment(105)
+        self.assertEqual(history[59]['Active Loans'], 1)
+        self.assertEqual(history[104]['Active Loans'], 2)
+
+
+class RunBatchTest(unittest.TestCase):
+    def test_matches_single_runs(self):
+        expected = [LoanPortfolio(p, r).run_full_investment(120)[0] for p, r in [(1000, 0.12), (500, 0.3)]]
+        self.assertEqual(run_batch([1000, 500], [0.12, 0.3], 120), expected)
+
+    def test_rejects_mismatched_inputs(self):
+        with self.assertRaises(ValueError):
+            run_batch([1000] * 100, [0.12] * 70, 60)
+
+    def test_worker_pool_matches_in_process(self):
+        count = PARALLEL_BATCH_THRESHOLD * 3
+        principals = [500 + 25 * i for i in range(count)]
+        rates = [0.01 * (i % 30) for i in range(count)]
+        expected = run_batch(principals, rates, 120, max_workers=1)
+        self.assertEqual(run_batch(principals, rates, 120, max_workers=2), expected)
+
+    def test_rejects_non_positive_max_workers(self):
+        with self.assertRaises(ValueError):
+            run_batch([1000] * 100, [0.12] * 100, 60, max_workers=0)
+
+
+class WriteHistoryCsvTest(unittest.TestCase):
+    HEADER = ('Period,Total Payment Received,Interest Collected,Principal Repaid,'
+              'Active Loans,New Loans Issued,Cash Available for Loans,Total Loans Issued\r\n')
+
+    def write_and_read(self, rows):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'history.csv')
+            write_history_csv(path, rows)
+            with open(path, newline='') as csvfile:
+                return csvfile.read()
+
+    def test_short_history(self):
+        rows = [
+            (1, 22.244447, 10.0, 12.244447, 1, 0, 22.244447, 1),
+            (2, 1022.5, 9.875, 1012.625, 2, 1, 44.005, 2),
+        ]
+        self.assertEqual(self.write_and_read(rows), self.HEADER + (
+            '1,22.24,10.00,12.24,1,0,22.24,1\r\n'
+            '2,1022.50,9.88,1012.62,2,1,44.01,2\r\n'
+        ))
+
+    def test_history_spanning_several_batches(self):
+        count = 2 * CSV_WRITE_BATCH + 3
+        rows = [(i, i / 8, 0.125, i / 8 - 0.125, i, 0, 0.5, i) for i in range(1, count + 1)]
+        expected = self.HEADER + ''.join(
+            f'{i},{i / 8:.2f},0.12,{i / 8 - 0.125:.2f},{i},0,0.50,{i}\r\n' for i in range(1, count + 1)
+        )
+        self.assertEqual(self.write_and_read(rows), expected)
+
+    def test_empty_history_writes_header(self):
+        self.assertEqual(self.write_and_read([]), self.HEADER)
+
+
+if __name__ == '__main__':
+    unittest.main()